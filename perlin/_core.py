@@ -1,53 +1,58 @@
 import math
+from functools import lru_cache
 from typing import TypeVar
 
 import numpy as np
 from numpy.typing import DTypeLike
 
-from ._hash import get_gradient_vector
+from ._hash import get_gradient_vector, get_gradient_vectors
 
+T = TypeVar("T", float, np.ndarray)
 
-def _grid_dot_product(grid_x: int, grid_y: int, x: float, y: float, octave: int) -> float:
-    """
-    Compute contribution to the Perlin noise corresponding to the dot product
-    between the gradient vector at the grid point and the displacement vector
-    to the point.
 
-    Args:
-        grid_x: x coordinate of grid point.
-        grid_y: y coordinate of grid point.
-        x: x coordinate of point.
-        y: y coordinate of point.
-        octave: index enumerating scale of noise.
-
-    Returns:
-        Dot product value, normalized to [-1, 1].
+def _smootherstep(t: T) -> T:
+    """
+    "Smootherstep" function for t in [0, 1], i.e. first and second derivatives
+    vanish at endpoints.
     """
 
-    grad_x, grad_y = get_gradient_vector(grid_x, grid_y, octave=octave)
-    disp_x = x - grid_x
-    disp_y = y - grid_y
-    dot = grad_x * disp_x + grad_y * disp_y
-
-    # in 2d, dot is in [-1/sqrt(2), 1/sqrt(2)]. so normalize by multiplying by sqrt(2).
-    return math.sqrt(2) * dot
+    return t * t * t * (t * (6 * t - 15) + 10)
 
 
-T = TypeVar("T", float, np.ndarray)
+@lru_cache(maxsize=32)
+def _cell_coefficients(resolution: int, dtype: np.dtype) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the coefficients that `_render_cells()` expands each cell in.
+    These only depend on the position of each pixel within a cell, so they are
+    the same for every cell of a given resolution, and are cached. The arrays
+    are read-only, since they are shared between callers.
 
+    Args:
+        resolution: number of pixels along each axis of a cell.
+        dtype: data type to use.
 
-def _interpolate(a0: T, a1: T, t: T) -> T:
-    """
-    Interpolate between a0 and a1, where t is in [0, 1]. Uses "smootherstep"
-    function, i.e. first and second derivatives vanish at endpoints.
+    Returns:
+        Tuple of x coefficients, with shape (resolution, 4), and y
+        coefficients, with shape (4, resolution).
     """
 
-    return (a1 - a0) * t * t * t * (t * (6 * t - 15) + 10) + a0
+    # position of each pixel within a cell, along either axis, and the
+    # corresponding interpolation weights
+    t = np.linspace(0, 1, num=resolution, endpoint=False, dtype=dtype)
+    w = _smootherstep(t)
+
+    x_coeffs = np.stack([(1 - w) * t, w * (t - 1), 1 - w, w], axis=-1)
+    y_coeffs = np.stack([1 - w, (1 - w) * t, w, w * (t - 1)])
+    x_coeffs.flags.writeable = False
+    y_coeffs.flags.writeable = False
+    return x_coeffs, y_coeffs
 
 
-def perlin(x: float, y: float, octave: int) -> float:
+def perlin(x: T, y: T, octave: int) -> T:
     """
-    Returns Perlin noise at point, normalized to [-1, 1].
+    Returns Perlin noise at point, normalized to [-1, 1]. Also accepts arrays
+    of coordinates, in which case the noise is evaluated at every point at
+    once.
 
     Args:
         x: x coordinate.
@@ -55,34 +60,206 @@ def perlin(x: float, y: float, octave: int) -> float:
         octave: index enumerating scale of noise.
     """
 
-    # determine grid points
-    grid_x = int(x)
-    grid_y = int(y)
+    if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+        return _perlin_array(np.asarray(x), np.asarray(y), octave)
 
-    # compute contributions from each grid point
-    bottom_left = _grid_dot_product(grid_x, grid_y, x, y, octave=octave)
-    bottom_right = _grid_dot_product(grid_x + 1, grid_y, x, y, octave=octave)
-    top_right = _grid_dot_product(grid_x + 1, grid_y + 1, x, y, octave=octave)
-    top_left = _grid_dot_product(grid_x, grid_y + 1, x, y, octave=octave)
+    # determine grid points. `int()` truncates towards zero, which picks the
+    # wrong grid point for negative coordinates.
+    grid_x = math.floor(x)
+    grid_y = math.floor(y)
 
-    # interpolation weights
+    # displacement from the bottom left grid point
     t_x = x - grid_x
     t_y = y - grid_y
 
+    # compute contributions from each grid point, i.e. the dot product between
+    # the gradient vector and the displacement vector to the point. this is
+    # inlined, since function calls are relatively expensive. arguments are
+    # passed positionally, since keywords make the cache key slower to build.
+    grad_x, grad_y = get_gradient_vector(grid_x, grid_y, octave)
+    bottom_left = grad_x * t_x + grad_y * t_y
+    grad_x, grad_y = get_gradient_vector(grid_x + 1, grid_y, octave)
+    bottom_right = grad_x * (t_x - 1) + grad_y * t_y
+    grad_x, grad_y = get_gradient_vector(grid_x + 1, grid_y + 1, octave)
+    top_right = grad_x * (t_x - 1) + grad_y * (t_y - 1)
+    grad_x, grad_y = get_gradient_vector(grid_x, grid_y + 1, octave)
+    top_left = grad_x * t_x + grad_y * (t_y - 1)
+
+    # interpolation weights. the x weight is shared by the bottom and top edges,
+    # so evaluate the smootherstep polynomial once per axis, inlined like the
+    # dot products above, and lerp inline.
+    w_x = t_x * t_x * t_x * (t_x * (6 * t_x - 15) + 10)
+    w_y = t_y * t_y * t_y * (t_y * (6 * t_y - 15) + 10)
+
     # interpolate value
-    bottom = _interpolate(bottom_left, bottom_right, t_x)
-    top = _interpolate(top_left, top_right, t_x)
-    value = _interpolate(bottom, top, t_y)
+    bottom = (bottom_right - bottom_left) * w_x + bottom_left
+    top = (top_right - top_left) * w_x + top_left
+    value = (top - bottom) * w_y + bottom
 
     return value
 
 
+def _perlin_array(x: np.ndarray, y: np.ndarray, octave: int) -> np.ndarray:
+    """
+    Vectorized version of `perlin()`, for arrays of coordinates. `x` and `y`
+    are broadcast against each other.
+    """
+
+    # 0-d arrays would make the hashes below numpy scalar arithmetic, which
+    # warns on overflow, so broadcast the coordinates to a common shape with at
+    # least one dimension, and restore the shape at the end
+    shape = np.broadcast_shapes(x.shape, y.shape)
+    x, y = (np.atleast_1d(a) for a in np.broadcast_arrays(x, y))
+
+    # compute in a common floating type. otherwise, integer coordinates would
+    # stay integers through `np.floor()`, and mixed precisions would pick the
+    # gradient precision from `x` alone.
+    dtype = np.result_type(x, y, np.float32)
+    x = x.astype(dtype, copy=False)
+    y = y.astype(dtype, copy=False)
+
+    grid_x = np.floor(x)
+    grid_y = np.floor(y)
+
+    t_x = x - grid_x
+    t_y = y - grid_y
+
+    # gradient vectors at the four corners of the cell containing each point,
+    # hashed for all points at once
+    ix = grid_x.astype(np.int64)
+    iy = grid_y.astype(np.int64)
+    g_bl = get_gradient_vectors(ix, iy, octave=octave, dtype=dtype)
+    g_br = get_gradient_vectors(ix + 1, iy, octave=octave, dtype=dtype)
+    g_tr = get_gradient_vectors(ix + 1, iy + 1, octave=octave, dtype=dtype)
+    g_tl = get_gradient_vectors(ix, iy + 1, octave=octave, dtype=dtype)
+
+    bottom_left = _dot_product(t_x, t_y, g_bl)
+    bottom_right = _dot_product(t_x - 1, t_y, g_br)
+    top_right = _dot_product(t_x - 1, t_y - 1, g_tr)
+    top_left = _dot_product(t_x, t_y - 1, g_tl)
+
+    w_x = _smootherstep(t_x)
+    w_y = _smootherstep(t_y)
+
+    # interpolate value
+    bottom = (bottom_right - bottom_left) * w_x + bottom_left
+    top = (top_right - top_left) * w_x + top_left
+    value = (top - bottom) * w_y + bottom
+
+    return value.reshape(shape)
+
+
+def _dot_product(
+    disp_x: np.ndarray,
+    disp_y: np.ndarray,
+    grad: np.ndarray,
+) -> np.ndarray:
+    """
+    Compute dot products between gradient vectors and displacement vectors.
+    Displacements are given per component, so that they can be broadcast
+    against each other rather than materialized as a meshgrid.
+
+    Args:
+        disp_x: x component of displacement vectors.
+        disp_y: y component of displacement vectors.
+        grad: gradient vectors, with shape (..., 2).
+
+    Returns:
+        Array with the broadcast shape of the inputs.
+    """
+
+    return grad[..., 0] * disp_x + grad[..., 1] * disp_y
+
+
+def _render_cells(
+    grads: np.ndarray,
+    x_coeffs: np.ndarray,
+    y_coeffs: np.ndarray,
+    out: np.ndarray,
+) -> np.ndarray:
+    """
+    Render a rectangular block of cells of a single octave of Perlin noise,
+    normalized to [-1, 1].
+
+    For the cell with corners bl, br, tl, tr, and smootherstep weights w_x,
+    w_y, the bottom edge is
+
+        (1 - w_x) * (g_bl . (t_x, t_y)) + w_x * (g_br . (t_x - 1, t_y))
+            = A_b(x) + B_b(x) * t_y
+
+    where A_b and B_b only depend on x, and similarly for the top edge. So the
+    value is a sum of 4 products of a function of x and a function of y:
+
+        value = A_b(x) * (1 - w_y) + B_b(x) * (1 - w_y) * t_y
+            + A_t(x) * w_y + B_t(x) * w_y * (t_y - 1)
+
+    The x factors are linear combinations of the x coefficients, with the
+    gradient vectors of each cell as weights, so they are computed as a matrix
+    product as well. The y factors are the same for every cell. The block is
+    then a single matrix product with an inner dimension of 4, which writes
+    every pixel exactly once.
+
+    Args:
+        grads: gradient vectors at the grid points of the block, with shape
+            (n_cx + 1, n_cy + 1, 2).
+        x_coeffs: x coefficients, as returned by `_cell_coefficients()`.
+        y_coeffs: y coefficients, as returned by `_cell_coefficients()`. These
+            may be scaled, which scales the result.
+        out: array with shape (n_cx * resolution, n_cy * resolution) to write
+            the result to. It does not need to be contiguous.
+
+    Returns:
+        `out`.
+    """
+
+    resolution = x_coeffs.shape[0]
+    n_cx = grads.shape[0] - 1
+    n_cy = grads.shape[1] - 1
+
+    if resolution == 1:
+        # every pixel is at a grid point, where the noise vanishes
+        out[...] = 0
+        return out
+
+    # gradient vectors at the corners of each cell. the corners are shifted
+    # views, so adjacent cells share them without any copies.
+    g_bl = grads[:-1, :-1]
+    g_br = grads[1:, :-1]
+    g_tl = grads[:-1, 1:]
+    g_tr = grads[1:, 1:]
+
+    # weights of the x coefficients in each x factor, indexed by [cell along x,
+    # x coefficient, cell along y, term]. the terms are A_b, B_b, A_t, B_t.
+    weights = np.zeros((n_cx, 4, n_cy, 4), dtype=out.dtype)
+    weights[:, 0, :, 0] = g_bl[..., 0]
+    weights[:, 1, :, 0] = g_br[..., 0]
+    weights[:, 2, :, 1] = g_bl[..., 1]
+    weights[:, 3, :, 1] = g_br[..., 1]
+    weights[:, 0, :, 2] = g_tl[..., 0]
+    weights[:, 1, :, 2] = g_tr[..., 0]
+    weights[:, 2, :, 3] = g_tl[..., 1]
+    weights[:, 3, :, 3] = g_tr[..., 1]
+
+    # x factors, indexed by [cell along x, pixel along x, cell along y, term]
+    x_factors = np.matmul(x_coeffs, weights.reshape(n_cx, 4, n_cy * 4))
+    x_factors = x_factors.reshape(n_cx, resolution, n_cy, 4)
+
+    # view the block as (cells along x, pixels along x, cells along y, pixels
+    # along y). splitting axes never needs a copy, so this is a view.
+    out4 = out.reshape(n_cx, resolution, n_cy, resolution)
+    np.matmul(x_factors, y_coeffs, out=out4)
+
+    return out
+
+
 def perlin_cell(
     grid_x: int,
     grid_y: int,
     octave: int,
     resolution: int,
     dtype: DTypeLike = "float32",
+    grads: np.ndarray | None = None,
+    out: np.ndarray | None = None,
 ) -> np.ndarray:
     """
     Returns Perlin noise, normalized to [-1, 1], for the cell at the specified
@@ -97,39 +274,31 @@ def perlin_cell(
         octave: index enumerating scale of noise.
         resolution: cell will contain `resolution` x `resolution` pixels.
         dtype: data type to use.
+        grads: gradient vectors at the four corner grid points, with shape
+            (2, 2, 2), as returned by `get_gradient_field(grid_x, grid_y, 2,
+            2, octave)`. If None, they will be computed.
+        out: array with shape (resolution, resolution) to write the result
+            to. If None, a new array will be allocated.
 
     Returns:
         Array with shape (resolution, resolution)."""
 
-    grids = (
-        (grid_x, grid_y),  # bottom left
-        (grid_x + 1, grid_y),  # bottom right
-        (grid_x + 1, grid_y + 1),  # top right
-        (grid_x, grid_y + 1),  # top left
-    )
-
-    t = np.linspace(0, 1, num=resolution, endpoint=False, dtype=dtype)
-    xs = grid_x + t
-    ys = grid_y + t
-    coords = np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1)  # (res, res, 2)
-
-    # compute dot products between gradient and displacement vectors
-    dots: list[np.ndarray] = []
-
-    for grid in grids:
-        grad = np.array(get_gradient_vector(grid[0], grid[1], octave=octave), dtype=dtype)
-        disp = coords - np.array(grid, dtype=dtype)  # (res, res, 2)
-        dot = (disp * grad).sum(axis=-1)  # (res, res)
-
-        # in 2d, dot is in [-1/sqrt(2), 1/sqrt(2)]. so normalize by multiplying by sqrt(2).
-        dots.append(dot * math.sqrt(2))
-
-    # interpolate
-    t_x = t[:, None]
-    t_y = t[None, :]
-
-    bottom = _interpolate(dots[0], dots[1], t_x)
-    top = _interpolate(dots[3], dots[2], t_x)
-    value = _interpolate(bottom, top, t_y)
-
-    return value
+    if grads is None:
+        # for only four grid points, the cached scalar lookups are much cheaper
+        # than hashing arrays, and adjacent cells share corners
+        grads = np.array(
+            [
+                [get_gradient_vector(grid_x, grid_y, octave), get_gradient_vector(grid_x, grid_y + 1, octave)],
+                [get_gradient_vector(grid_x + 1, grid_y, octave), get_gradient_vector(grid_x + 1, grid_y + 1, octave)],
+            ],
+            dtype=dtype,
+        )
+    else:
+        # otherwise, wider gradients would promote every intermediate array
+        grads = grads.astype(dtype, copy=False)
+
+    if out is None:
+        out = np.empty((resolution, resolution), dtype=dtype)
+
+    x_coeffs, y_coeffs = _cell_coefficients(resolution, np.dtype(dtype))
+    return _render_cells(grads, x_coeffs, y_coeffs, out=out)
@@ -1,29 +1,76 @@
 import hashlib
-import math
 import os
+import struct
+from functools import lru_cache
+from typing import TypeVar
+
+import numpy as np
+from numpy.typing import DTypeLike
 
 _MAX_UINT32 = 0xFFFFFFFF
+_MAX_UINT64 = 0xFFFFFFFFFFFFFFFF
+
+# we empirically find that adding an offset to the input makes the FNV hash
+# more "random" for inputs close to zero. it may have something to do with
+# long strings of zero-bytes causing problems in the hash.
+_FNV_OFFSET = 0x9E3779B9  # offset picked arbitrarily
+
+# gradient vectors are picked from a fixed table of evenly spaced unit
+# vectors, which replaces a cos/sin evaluation with a table lookup. the number
+# of vectors must be a power of 2, so the top bits of the hash give the index.
+#
+# in 2d, the dot product between a unit vector and a displacement within a cell
+# is in [-1/sqrt(2), 1/sqrt(2)]. so the vectors are scaled by sqrt(2), which
+# normalizes the noise to [-1, 1] without an extra multiply per pixel.
+_GRAD_BITS = 4
+_GRAD_ANGLES = 2 * np.pi * np.arange(1 << _GRAD_BITS) / (1 << _GRAD_BITS)
+_GRAD_TABLE = (np.sqrt(2) * np.stack([np.cos(_GRAD_ANGLES), np.sin(_GRAD_ANGLES)], axis=-1)).astype(np.float32)
+_GRAD_TUPLES: tuple[tuple[float, float], ...] = tuple(map(tuple, _GRAD_TABLE.tolist()))
+
+# precompiled byte conversions, which are cheaper than `int.to_bytes()` and
+# `int.from_bytes()`
+_pack_uint32 = struct.Struct("<I").pack
+_pack_3_uint32 = struct.Struct("<3I").pack
+_unpack_hash_uint32 = struct.Struct(">I").unpack_from
 
+U = TypeVar("U", int, np.ndarray)
 
-def _hash_int(n: int) -> int:
+
+def _hash_int(n: U) -> U:
     """
-    Hash an integer to a uint32.
+    Hash an integer to a uint32, using the SplitMix64 finalizer. Also accepts
+    a uint64 array, in which case the wrap-around of the array arithmetic
+    makes the masking a no-op.
+    """
+
+    # pure integer arithmetic, so this is much cheaper than a cryptographic
+    # hash while still avalanching well.
+    x = (n + 0x9E3779B97F4A7C15) & _MAX_UINT64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E7B5) & _MAX_UINT64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MAX_UINT64
+    return (x ^ (x >> 31)) & _MAX_UINT32
+
+
+def _hash_int_md5(n: int) -> int:
+    """
+    Hash an integer to a uint32, using MD5 hash.
     """
 
     # cast integer to uint32, then convert to bytes. we use little-endian since
     # the least-significant-byte varies the most and should be in front.
-    n_bts = int.to_bytes(n & _MAX_UINT32, length=4, byteorder="little")
-    hash = hashlib.md5(n_bts).digest()
-    return int.from_bytes(hash) & _MAX_UINT32
+    hash = hashlib.md5(_pack_uint32(n & _MAX_UINT32)).digest()
 
+    # take the last 4 bytes as a big-endian uint32
+    return _unpack_hash_uint32(hash, 12)[0]
 
-def _hash_combine(a: int, b: int) -> int:
+
+def _hash_combine(a: U, b: U) -> U:
     """
-    Combine two uint32 hashes. Uses same method as boost::hash_combine.
+    Combine two uint32 hashes. Uses same method as boost::hash_combine. Also
+    accepts uint32 arrays, which are broadcast against each other.
     """
 
-    a ^= (b + 0x9E3779B9 + ((a << 6) & _MAX_UINT32) + (a >> 2)) & _MAX_UINT32
-    return a
+    return a ^ ((b + 0x9E3779B9 + ((a << 6) & _MAX_UINT32) + (a >> 2)) & _MAX_UINT32)
 
 
 def _hash_grid_point_md5(x: int, y: int, octave: int) -> int:
@@ -31,6 +78,14 @@ def _hash_grid_point_md5(x: int, y: int, octave: int) -> int:
     Hash grid point to a uint32, using MD5 hash.
     """
 
+    return _hash_combine(_hash_combine(_hash_int_md5(x), _hash_int_md5(y)), _hash_int_md5(octave))
+
+
+def _hash_grid_point_splitmix(x: int, y: int, octave: int) -> int:
+    """
+    Hash grid point to a uint32, using SplitMix64 finalizer.
+    """
+
     return _hash_combine(_hash_combine(_hash_int(x), _hash_int(y)), _hash_int(octave))
 
 
@@ -39,35 +94,93 @@ def _hash_grid_point_fnv(x: int, y: int, octave: int) -> int:
     Hash grid point to a uint32, using FNV-1a hash.
     """
 
-    # we empirically find that adding an offset to the input makes the hash
-    # more "random" for inputs close to zero. it may have something to do with
-    # long strings of zero-bytes causing problems in the hash.
-    _OFFSET = 0x9E3779B9  # offset picked arbitrarily
-
     # cast integer to uint32, then convert to bytes. we use little-endian since
     # the least-significant-byte varies the most and should be in front.
-    x_bts = int.to_bytes((x + _OFFSET) & _MAX_UINT32, length=4, byteorder="little")
-    y_bts = int.to_bytes((y + _OFFSET) & _MAX_UINT32, length=4, byteorder="little")
-    o_bts = int.to_bytes((octave + _OFFSET) & _MAX_UINT32, length=4, byteorder="little")
+    bts = _pack_3_uint32(
+        (x + _FNV_OFFSET) & _MAX_UINT32,
+        (y + _FNV_OFFSET) & _MAX_UINT32,
+        (octave + _FNV_OFFSET) & _MAX_UINT32,
+    )
 
-    # 32-bit variant of FNV-1a
+    # 32-bit variant of FNV-1a. the low 32 bits of a product only depend on the
+    # low 32 bits of its factors, and xor-ing a byte only touches the low 8
+    # bits, so it is enough to mask once at the end.
     hash = 0x811C9DC5
-    for char in x_bts + y_bts + o_bts:
-        hash ^= char
-        hash = (hash * 0x01000193) & _MAX_UINT32
+    for char in bts:
+        hash = (hash ^ char) * 0x01000193
+
+    return hash & _MAX_UINT32
+
+
+def _hash_grid_points_splitmix(xs: np.ndarray, ys: np.ndarray, octave: int) -> np.ndarray:
+    """
+    Vectorized version of `_hash_grid_point_splitmix()`. Coordinates are
+    hashed separately before being combined, so `xs` and `ys` are broadcast
+    against each other only after the expensive part.
+    """
+
+    # casting signed to unsigned integers wraps around, like the masking in the
+    # scalar version.
+    hx = _hash_int(xs.astype(np.uint64)).astype(np.uint32)
+    hy = _hash_int(ys.astype(np.uint64)).astype(np.uint32)
+    # the octave is a single integer, so it is cheaper to hash it with python
+    # integers than as an array. it is still wrapped in an array, since numpy
+    # warns on overflow in scalar arithmetic.
+    ho = np.array([_hash_int(octave)], dtype=np.uint32)
+    return _hash_combine(_hash_combine(hx, hy), ho)
+
+
+def _hash_grid_points_fnv(xs: np.ndarray, ys: np.ndarray, octave: int) -> np.ndarray:
+    """
+    Vectorized version of `_hash_grid_point_fnv()`. The hash state after the
+    x coordinate only depends on `xs`, so it is computed before broadcasting
+    against `ys`.
+    """
+
+    words = (
+        (xs + _FNV_OFFSET).astype(np.uint32),
+        (ys + _FNV_OFFSET).astype(np.uint32),
+        np.uint32((octave + _FNV_OFFSET) & _MAX_UINT32),
+    )
+
+    # 32-bit variant of FNV-1a, feeding each word in little-endian byte order.
+    # uint32 multiplication wraps around, so no masking is needed.
+    hash: np.ndarray = np.full(xs.shape, 0x811C9DC5, dtype=np.uint32)
+    for word in words:
+        for shift in (0, 8, 16, 24):
+            hash = (hash ^ ((word >> shift) & 0xFF)) * np.uint32(0x01000193)
 
     return hash
 
 
-_hash_variant = os.getenv("PERLIN_HASH", "FNV").upper()
+def _hash_grid_points_md5(xs: np.ndarray, ys: np.ndarray, octave: int) -> np.ndarray:
+    """
+    Vectorized version of `_hash_grid_point_md5()`. MD5 cannot be expressed
+    with array arithmetic, so this still hashes each coordinate separately,
+    but only once per distinct element of `xs` and `ys`.
+    """
+
+    hash_md5 = np.vectorize(_hash_int_md5, otypes=[np.uint32])
+    hx = hash_md5(xs)
+    hy = hash_md5(ys)
+    ho = np.array([_hash_int_md5(octave)], dtype=np.uint32)
+    return _hash_combine(_hash_combine(hx, hy), ho)
+
 
+_hash_variant = os.getenv("PERLIN_HASH", "SPLITMIX").upper()
 
+
+# adjacent points share grid points, so `perlin()` asks for the same gradient
+# vectors over and over. the hashing variant is fixed at import, so caching is
+# safe.
+@lru_cache(maxsize=4096)
 def get_gradient_vector(x: int, y: int, octave: int) -> tuple[float, float]:
     """
     Get gradient vector for a given grid point. Set the `PERLIN_HASH`
-    environment variable to pick between two hashing variants:
+    environment variable to pick between hashing variants:
 
-    - FNV: Use FNV-1a hash. This is the default
+    - SPLITMIX: Use SplitMix64 finalizer. This is the default.
+    - FNV: Use FNV-1a hash.
     - MD5: Use MD5 hash.
 
     Args:
@@ -76,15 +189,69 @@ def get_gradient_vector(x: int, y: int, octave: int) -> tuple[float, float]:
         octave: index enumerating scale of noise.
 
     Returns:
-        2d unit vector.
+        2d vector with length sqrt(2), so that dot products with displacement
+        vectors within a cell are normalized to [-1, 1].
     """
 
-    if _hash_variant == "FNV":
+    if _hash_variant == "SPLITMIX":
+        h = _hash_grid_point_splitmix(x, y, octave)
+    elif _hash_variant == "FNV":
         h = _hash_grid_point_fnv(x, y, octave)
     elif _hash_variant == "MD5":
         h = _hash_grid_point_md5(x, y, octave)
     else:
         raise NotImplementedError(f"Hashing not implemented: {_hash_variant}")
 
-    angle = 2 * math.pi * h / (_MAX_UINT32 + 1)
-    return math.cos(angle), math.sin(angle)
+    return _GRAD_TUPLES[h >> (32 - _GRAD_BITS)]
+
+
+def get_gradient_vectors(xs: np.ndarray, ys: np.ndarray, octave: int, dtype: DTypeLike = "float32") -> np.ndarray:
+    """
+    Get gradient vectors for arrays of grid points. This is the vectorized
+    version of `get_gradient_vector()`, and uses the same hashing variant.
+
+    Args:
+        xs: integer x coordinates of grid points.
+        ys: integer y coordinates of grid points.
+        octave: index enumerating scale of noise.
+        dtype: data type to use.
+
+    Returns:
+        Array with shape (*shape, 2), where `shape` is the broadcast shape of
+        `xs` and `ys`.
+    """
+
+    if _hash_variant == "SPLITMIX":
+        h = _hash_grid_points_splitmix(xs, ys, octave)
+    elif _hash_variant == "FNV":
+        h = _hash_grid_points_fnv(xs, ys, octave)
+    elif _hash_variant == "MD5":
+        h = _hash_grid_points_md5(xs, ys, octave)
+    else:
+        raise NotImplementedError(f"Hashing not implemented: {_hash_variant}")
+
+    return _GRAD_TABLE[h >> (32 - _GRAD_BITS)].astype(dtype, copy=False)
+
+
+def get_gradient_field(x0: int, y0: int, nx: int, ny: int, octave: int, dtype: DTypeLike = "float32") -> np.ndarray:
+    """
+    Get gradient vectors for a rectangular block of grid points.
+
+    Args:
+        x0: x coordinate of first grid point.
+        y0: y coordinate of first grid point.
+        nx: number of grid points along x.
+        ny: number of grid points along y.
+        octave: index enumerating scale of noise.
+        dtype: data type to use.
+
+    Returns:
+        Array with shape (nx, ny, 2), where element [i, j] is the gradient
+        vector at grid point (x0 + i, y0 + j).
+    """
+
+    # hashes are computed per coordinate and then combined, so no meshgrid is
+    # needed. broadcasting gives each coordinate's hash to a whole row or column.
+    xs = np.arange(x0, x0 + nx)[:, None]
+    ys = np.arange(y0, y0 + ny)[None, :]
+    return get_gradient_vectors(xs, ys, octave=octave, dtype=dtype)
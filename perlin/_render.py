@@ -1,25 +1,27 @@
-from typing import Annotated
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 import numpy as np
-from pydantic import BaseModel
-from pydantic.functional_validators import AfterValidator
 
-from ._core import perlin_cell
+from ._core import _cell_coefficients, _render_cells
+from ._hash import get_gradient_field
 
 
-def _check_power_of_two(v: int) -> int:
-    assert v > 0 and v & (v - 1) == 0, f"{v} is not a power of 2"
-    return v
+def _check_power_of_two(v: int) -> None:
+    if not (v > 0 and v & (v - 1) == 0):
+        raise ValueError(f"{v} is not a power of 2")
 
 
-class RenderOpts(BaseModel):
+@dataclass(frozen=True, slots=True)
+class RenderOpts:
     """
     Options for rendering Perlin noise.
     """
 
     num_cells: int = 8
     """The image will contain `num_cells` x `num_cells` cells."""
-    resolution: Annotated[int, AfterValidator(_check_power_of_two)] = 64
+    resolution: int = 64
     """Each cell will contain `resolution` x `resolution` pixels. Must be a power of 2."""
     num_octaves: int = 1
     """Total number of noise scales."""
@@ -27,6 +29,74 @@ class RenderOpts(BaseModel):
     """Coordinate of the grid point at the rendered image origin."""
     dtype: str = "float32"
     """Data type to use."""
+    num_workers: int | None = None
+    """Number of threads to render with. If None, uses the number of CPUs."""
+
+    def __post_init__(self) -> None:
+        _check_power_of_two(self.resolution)
+        if self.num_octaves < 1:
+            raise ValueError(f"{self.num_octaves} is not a positive number of octaves")
+        if self.num_workers is not None and self.num_workers < 1:
+            raise ValueError(f"{self.num_workers} is not a positive number of workers")
+
+
+# approximate size, in bytes, of the blocks the image is rendered in. all
+# octaves of a block are accumulated before moving on, so that the block is
+# still cached when the next octave is added to it. the kernel writes each pixel
+# only once, so the whole working set does not need to fit in L2, and larger
+# blocks mainly cut the per-block overhead: for float32, blocks of 0.5 to 1 MiB
+# rendered fastest. the size is in bytes rather than pixels, so that it does not
+# depend on the data type.
+_BLOCK_BYTES = 1 << 20
+
+
+def _render_block_row(
+    octaves: list[tuple[np.ndarray, np.ndarray, np.ndarray]],
+    x0: int,
+    block_shape: tuple[int, int],
+    out: np.ndarray,
+) -> None:
+    """
+    Render a row of blocks of Perlin noise, accumulating all octaves. Blocks
+    must be aligned to cells, i.e. `x0` and `block_shape` must be multiples of
+    the cell resolution of every octave.
+
+    Args:
+        octaves: (gradient vectors, x coefficients, y coefficients) for each
+            octave. The gradient vectors are as returned by
+            `get_gradient_field()`, where element [0, 0] is the grid point at
+            the rendered image origin. The y coefficients must already be
+            scaled by the normalized amplitude.
+        x0: x index of first pixel in the row.
+        block_shape: shape of the blocks, in pixels.
+        out: image to write the row to.
+    """
+
+    # buffer for each block that is reused. each row has its own, so that rows
+    # can be rendered concurrently.
+    buffer = np.empty(block_shape, dtype=out.dtype)
+
+    for y0 in range(0, out.shape[1], block_shape[1]):
+        block = out[x0 : x0 + block_shape[0], y0 : y0 + block_shape[1]]
+        block_buffer = buffer[: block.shape[0], : block.shape[1]]
+
+        for i, (grads, x_coeffs, y_coeffs) in enumerate(octaves):
+            # gradient vectors at the grid points of the block
+            resolution = x_coeffs.shape[0]
+            c_x0 = x0 // resolution
+            c_y0 = y0 // resolution
+            block_grads = grads[
+                c_x0 : c_x0 + block.shape[0] // resolution + 1,
+                c_y0 : c_y0 + block.shape[1] // resolution + 1,
+            ]
+
+            if i == 0:
+                # the first octave is written directly to the block, so that
+                # the image does not need to be initialized
+                _render_cells(block_grads, x_coeffs, y_coeffs, out=block)
+            else:
+                _render_cells(block_grads, x_coeffs, y_coeffs, out=block_buffer)
+                block += block_buffer
 
 
 def render(opts: RenderOpts) -> np.ndarray:
@@ -44,9 +114,9 @@ def render(opts: RenderOpts) -> np.ndarray:
     num_cells = opts.num_cells
     resolution = opts.resolution
 
-    # prepare empty image
-    n_pixels = num_cells * resolution
-    image = np.zeros((n_pixels, n_pixels), dtype=opts.dtype)
+    # (amplitude, gradient vectors, x coefficients, y coefficients) for each
+    # octave
+    octaves: list[tuple[float, np.ndarray, np.ndarray, np.ndarray]] = []
 
     amp = 1.0  # amplitude of noise for current octave
     cum_amp = 0.0  # tracks sum of amplitudes; for renormalizing noise
@@ -54,23 +124,67 @@ def render(opts: RenderOpts) -> np.ndarray:
     for octave in range(opts.num_octaves):
         cum_amp += amp
 
-        for i in range(num_cells):
-            for j in range(num_cells):
-                s_i = slice(i * resolution, (i + 1) * resolution)
-                s_j = slice(j * resolution, (j + 1) * resolution)
-                image[s_i, s_j] += amp * perlin_cell(
-                    grid_x=opts.origin[0] + i,
-                    grid_y=opts.origin[1] + j,
-                    octave=octave,
-                    resolution=resolution,
-                    dtype=opts.dtype,
-                )
+        # once every pixel is at a grid point, where the noise vanishes, or the
+        # cells have no pixels left, the remaining octaves contribute nothing.
+        # their amplitudes still count towards the normalization.
+        if resolution <= 1:
+            amp /= 2
+            continue
+
+        # compute gradient vectors for all grid points at once, since adjacent
+        # cells share corners
+        grads = get_gradient_field(
+            opts.origin[0],
+            opts.origin[1],
+            num_cells + 1,
+            num_cells + 1,
+            octave=octave,
+            dtype=opts.dtype,
+        )
+
+        # coefficients are the same for every cell, so only evaluate them once
+        # for a single cell
+        x_coeffs, y_coeffs = _cell_coefficients(resolution, np.dtype(opts.dtype))
+
+        octaves.append((amp, grads, x_coeffs, y_coeffs))
 
         num_cells *= 2  # double number of cells
         resolution //= 2  # halve resolution
         amp /= 2  # halve amplitude
 
-    # renormalize noise based on cumulative amplitude
-    image = image / cum_amp
+    # renormalize noise based on cumulative amplitude. this is folded into the
+    # y coefficients, so that it does not need a separate pass over the image.
+    scaled_octaves = [(grads, x_coeffs, y_coeffs * (amp / cum_amp)) for amp, grads, x_coeffs, y_coeffs in octaves]
+
+    # blocks contain whole cells of the first octave, and hence of every octave
+    n_pixels = opts.num_cells * opts.resolution
+    if n_pixels == 0:
+        return np.empty((0, 0), dtype=opts.dtype)
+    if not scaled_octaves:
+        # only possible if `opts.resolution` is 1, so the noise vanishes
+        return np.zeros((n_pixels, n_pixels), dtype=opts.dtype)
+
+    # blocks extend along y, i.e. along the contiguous axis of the image, for as
+    # long as possible, so that each row of pixels in a block is a long
+    # contiguous run of memory, which streams through the cache better than many
+    # short ones. blocks are as short as possible along x, but at least a few
+    # pixels tall, since numpy's per-operation overhead dominates for very thin
+    # blocks.
+    block_rows = min(max(opts.resolution, 16), n_pixels)
+    block_pixels = _BLOCK_BYTES // np.dtype(opts.dtype).itemsize
+    block_cols = min(max(block_pixels // (block_rows * opts.resolution), 1), opts.num_cells) * opts.resolution
+
+    # prepare uninitialized image, since every pixel is written. rows of blocks
+    # write disjoint slices of it, and numpy releases the GIL inside array
+    # operations, so they are rendered in parallel threads.
+    image = np.empty((n_pixels, n_pixels), dtype=opts.dtype)
+
+    with ThreadPoolExecutor(max_workers=opts.num_workers or os.cpu_count()) as executor:
+        futures = [
+            executor.submit(_render_block_row, scaled_octaves, x0, (block_rows, block_cols), out=image)
+            for x0 in range(0, n_pixels, block_rows)
+        ]
+        for future in futures:
+            future.result()
 
     return image
@@ -1,31 +1,100 @@
+import dataclasses
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Literal
 
-import matplotlib.pyplot as plt
+import numpy as np
 import tyro
+from PIL import Image
 
 from perlin import RenderOpts, render
 
 
+def _make_bwr_lut() -> np.ndarray:
+    """
+    Returns a lookup table for the "bwr" color map, which goes from blue to
+    white to red, as an array with shape (256, 3).
+    """
+
+    x = np.linspace(0, 1, num=256)
+    lut = np.empty((256, 3))
+    lut[:, 0] = np.minimum(2 * x, 1)  # red
+    lut[:, 1] = 1 - np.abs(2 * x - 1)  # green
+    lut[:, 2] = np.minimum(2 * (1 - x), 1)  # blue
+    return np.round(255 * lut).astype(np.uint8)
+
+
+_BWR_LUT = _make_bwr_lut()
+
+# number of frames that are saved concurrently in the background
+_NUM_SAVE_WORKERS = 2
+
+
+def _save(arr: np.ndarray, out_path: Path, cmap: Literal["bwr", "gray"]) -> None:
+    """
+    Save rendered noise as an image. Note that this modifies `arr`.
+
+    Args:
+        arr: noise, normalized to [-1, 1].
+        out_path: path to output image file.
+        cmap: color map for the image.
+    """
+
+    # noise is normalized to [-1, 1], so map that range to 8-bit pixel values.
+    # this is done in-place, so that no image-sized temporaries are allocated
+    # and the array keeps its (float32 by default) dtype.
+    arr += 1
+    arr *= 127.5
+    np.clip(arr, 0, 255, out=arr)
+    img = arr.astype(np.uint8)
+    if cmap == "bwr":
+        img = _BWR_LUT[img]
+
+    Image.fromarray(img).save(out_path)
+
+
 def main(
     opts: RenderOpts,
     out_path: Path = Path("perlin.png"),
     cmap: Literal["bwr", "gray"] = "gray",
-    interpolation: Literal["nearest", "bilinear"] = "nearest",
+    num_frames: int = 1,
+    frame_step: tuple[int, int] = (1, 0),
 ) -> None:
     """
     Render Perlin noise.
 
     Args:
         opts: Perlin noise rendering options.
-        out_path: path to output image file.
+        out_path: path to output image file. If there are multiple frames, the
+            frame index is appended to the file name.
         cmap: color map for the image.
-        interpolation: used for displaying the image.
+        num_frames: number of frames to render, e.g. for an animation.
+        frame_step: offset of the origin between consecutive frames.
     """
-    
-    arr = render(opts)
-    plt.imshow(arr, cmap=cmap, interpolation=interpolation)
-    plt.savefig(out_path)
+
+    if num_frames < 1:
+        raise ValueError(f"{num_frames} is not a positive number of frames")
+
+    # images are encoded and written in the background, so that the next frame
+    # is rendered in the meantime. each frame is rendered to a new array, so
+    # there is no need to copy it.
+    with ThreadPoolExecutor(max_workers=_NUM_SAVE_WORKERS) as executor:
+        futures: list[Future[None]] = []
+        for i in range(num_frames):
+            origin = (opts.origin[0] + i * frame_step[0], opts.origin[1] + i * frame_step[1])
+            arr = render(dataclasses.replace(opts, origin=origin))
+
+            # encoding is much slower than rendering, so wait for an earlier
+            # frame to be saved before queueing this one. otherwise, every
+            # rendered frame would be kept in memory until it is saved.
+            if i >= _NUM_SAVE_WORKERS:
+                futures[i - _NUM_SAVE_WORKERS].result()
+
+            frame_path = out_path if num_frames == 1 else out_path.with_stem(f"{out_path.stem}_{i:04d}")
+            futures.append(executor.submit(_save, arr, frame_path, cmap))
+
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":